@@ -1,28 +1,638 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import duckdb
 import plotly.express as px
 import os
+import sys
+import io
 import json
+import codecs
+import hashlib
+import gzip
+import bz2
+import zipfile
+import importlib.util
+import tempfile
+import threading
+import shutil
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
+from openpyxl import load_workbook
 from typing import Tuple
 
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+HAS_CALAMINE = importlib.util.find_spec('python_calamine') is not None
+HAS_ZSTD = importlib.util.find_spec('zstandard') is not None
+
+# Presupuesto de memoria por sesión para los archivos ya parseados, preparados y limpios (uno solo para los tres)
+PARSE_CACHE_MB = int(os.environ.get('DASHBOARD_PARSE_CACHE_MB', '4096'))
+# Presupuesto para resultados derivados de un dataset (opciones, agregados, perfiles)
+QUERY_CACHE_MB = int(os.environ.get('DASHBOARD_QUERY_CACHE_MB', '256'))
+FIGURE_CACHE_MB = int(os.environ.get('DASHBOARD_FIGURE_CACHE_MB', '256'))
+# Presupuesto propio del cubo de agregados; uno más grande se reemplaza por una vista
+CUBE_CACHE_MB = int(os.environ.get('DASHBOARD_CUBE_CACHE_MB', '512'))
+
+# Almacén persistente compartido por todas las sesiones (una tabla DuckDB por área)
+STORE_PATH = os.environ.get('DASHBOARD_STORE', os.path.join('data', 'dashboard.duckdb'))
+
+# CSV y JSON mayores a este tamaño se cargan por bloques directo al almacén
+CHUNKED_CSV_MB = int(os.environ.get('DASHBOARD_CHUNKED_CSV_MB', '256'))
+CSV_CHUNK_ROWS = int(os.environ.get('DASHBOARD_CSV_CHUNK_ROWS', '200000'))
+# Búfer del lector CSV de DuckDB (el mínimo que admite): por defecto lee hasta 32 MB del archivo
+# de una vez, una copia extra de archivos medianos mientras arma las columnas
+DUCKDB_CSV_BUFFER = 2 * 1024 ** 2
+# JSON: un arreglo de registros o un registro por línea (NDJSON)
+JSON_EXTS = ['.json', '.ndjson', '.jsonl']
+JSON_BLOCK_BYTES = 1024 ** 2
+# Registros por lote: acota los objetos Python vivos antes de pasar a columnas
+JSON_CHUNK_ROWS = int(os.environ.get('DASHBOARD_JSON_CHUNK_ROWS', '20000'))
+# Hilos para leer en paralelo varios archivos subidos a la vez
+INGEST_WORKERS = int(os.environ.get('DASHBOARD_INGEST_WORKERS', str(min(8, os.cpu_count() or 1))))
+
+# Comprimidos: se descomprimen mientras se leen; un .zip puede traer varios archivos
+COMPRESSED_EXTS = ['.gz', '.bz2', '.zst', '.zip']
+# Bytes comprimidos que se descomprimen para estimar el tamaño cuando el formato no lo registra
+SIZE_SAMPLE_BYTES = 1024 ** 2
+# Formatos columnares (requieren pyarrow): se leen sin copiar el upload y solo con las columnas elegidas
+ARROW_EXTS = ['.parquet', '.feather', '.arrow', '.ipc']
+# .xlsx mayores a este tamaño (ya comprimido) se cargan hoja por hoja y por bloques al almacén
+CHUNKED_EXCEL_MB = int(os.environ.get('DASHBOARD_CHUNKED_EXCEL_MB', '32'))
+
+# Lector de Excel: calamine (Rust, pandas >= 2.2) si está instalado; si no, openpyxl
+EXCEL_ENGINE = os.environ.get('DASHBOARD_EXCEL_ENGINE', 'calamine' if HAS_CALAMINE else 'openpyxl')
+
+# Columnas de texto con distintos/filas por debajo de este ratio pasan a categóricas
+CATEGORY_MAX_RATIO = 0.5
+
+# Tope de puntos por gráfico personalizado (barras, líneas, pastel)
+MAX_CHART_POINTS = int(os.environ.get('DASHBOARD_MAX_CHART_POINTS', '2000'))
+# Las líneas se consultan con más detalle y se reducen a LINE_POINT_BUDGET conservando picos
+LINE_FETCH_POINTS = int(os.environ.get('DASHBOARD_LINE_FETCH_POINTS', '100000'))
+LINE_POINT_BUDGET = int(os.environ.get('DASHBOARD_LINE_POINT_BUDGET', '2000'))
+# Dispersión: muestra de filas crudas; por encima de WEBGL_MIN_POINTS se dibuja con WebGL
+SCATTER_MAX_POINTS = int(os.environ.get('DASHBOARD_SCATTER_MAX_POINTS', '200000'))
+WEBGL_MIN_POINTS = int(os.environ.get('DASHBOARD_WEBGL_MIN_POINTS', '5000'))
+# Segmentadores con más valores que este tope se filtran con búsqueda por prefijo paginada
+SEGMENT_OPTIONS_MAX = int(os.environ.get('DASHBOARD_SEGMENT_OPTIONS_MAX', '500'))
+SEGMENT_PAGE_SIZE = 50
+# Solo se materializa el cubo si reduce las filas al menos a esta fracción
+CUBE_MAX_RATIO = float(os.environ.get('DASHBOARD_CUBE_MAX_RATIO', '0.5'))
+# Barras top-N del análisis automático: N por defecto; el resto se agrupa en 'Otros'
+TOP_N = int(os.environ.get('DASHBOARD_TOP_N', '10'))
+AGGREGATIONS = {'Suma': 'SUM', 'Promedio': 'AVG', 'Conteo': 'COUNT'}
+# Granularidades para agrupar fechas y su duración aproximada en días
+DATE_GRAINS = [('day', 1), ('week', 7), ('month', 30.44), ('quarter', 91.31), ('year', 365.25)]
+
+DATE_FORMATS = ['%d/%m/%Y', '%d-%m-%Y', '%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S', '%Y/%m/%d', '%m/%d/%Y']
+ISO_DATE_FORMATS = ['%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S']
+DATE_KEYWORDS = ['fecha', 'date']
+# Filas de muestra para inferir el formato de cada columna de fecha al cargar
+DATE_SAMPLE_ROWS = 1000
+# Fracción mínima de la muestra que debe interpretarse como fecha para convertir la columna
+DATE_MIN_PARSE_RATE = 0.9
+
+# Roles de las columnas clave del dashboard, detectados una vez por dataset sobre una muestra
+ROLE_KEYWORDS = {
+    'fecha': DATE_KEYWORDS,
+    'monto': ['venta', 'monto', 'total', 'ingreso'],
+    'producto': ['producto', 'item', 'articulo', 'sku'],
+    'local': ['local', 'tienda', 'sucursal'],
+    'region': ['region', 'ciudad', 'zona', 'pais'],
+}
+DIMENSION_ROLES = ['producto', 'local', 'region']
+ROLE_SAMPLE_ROWS = 10000
+
+# Secciones que se re-ejecutan solas al usar sus widgets (st.fragment, Streamlit >= 1.37);
+# en versiones previas se vuelve a ejecutar la página completa
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda f: f)
+
+# --- Caché ---
+class LRUCache:
+    # Caché LRU acotada por bytes: al superar max_bytes se expulsan las entradas menos usadas
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key][0]
+
+    def put(self, key, value, nbytes: int) -> None:
+        if key in self._items:
+            self.nbytes -= self._items.pop(key)[1]
+        if nbytes > self.max_bytes:
+            return
+        self._items[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.nbytes -= evicted
+
+def session_cache(name: str, max_bytes: int) -> LRUCache:
+    if name not in st.session_state:
+        st.session_state[name] = LRUCache(max_bytes)
+    return st.session_state[name]
+
+def approx_nbytes(value) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approx_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+def data_cache() -> LRUCache:
+    # Archivos parseados ('lectura'), preparados ('preparado') y limpios ('limpio') comparten presupuesto
+    return session_cache('data_cache', PARSE_CACHE_MB * 1024 ** 2)
+
+def column_buffers(values: pd.Series) -> set:
+    # Direcciones de memoria de los datos de una columna (Arrow o numpy); vacío si no se pueden ver
+    array = values.array
+    if hasattr(array, '__arrow_array__'):
+        data = array.__arrow_array__()
+        chunks = data.chunks if hasattr(data, 'chunks') else [data]
+        return {b.address for chunk in chunks for b in chunk.buffers() if b is not None and b.size}
+    if values.dtype != object and isinstance(values.dtype, np.dtype):
+        return {values.to_numpy().__array_interface__['data'][0]}
+    return set()
+
+def frame_nbytes(df: pd.DataFrame, shared_with: pd.DataFrame = None) -> int:
+    # Bytes de df sin las columnas cuyos datos ya están en shared_with (otra entrada de la caché):
+    # la copia superficial de la limpieza no se cuenta dos veces
+    if shared_with is None:
+        return int(df.memory_usage(deep=True).sum())
+    known = set().union(*(column_buffers(shared_with.iloc[:, i]) for i in range(shared_with.shape[1])))
+    total = 0
+    for i in range(df.shape[1]):
+        buffers = column_buffers(df.iloc[:, i])
+        if not buffers or not buffers <= known:
+            total += int(df.iloc[:, i].memory_usage(deep=True, index=False))
+    return total
+
+def memoized(key, compute):
+    # Resultados que solo dependen de la versión del dataset: la clave debe incluirla
+    cache = session_cache('query_cache', QUERY_CACHE_MB * 1024 ** 2)
+    if key not in cache:
+        value = compute()
+        cache.put(key, value, approx_nbytes(value))
+        return value
+    return cache.get(key)
+
+def figure_nbytes(fig) -> int:
+    total = 4096
+    for trace in fig.data:
+        for attr in ('x', 'y', 'labels', 'values'):
+            data = getattr(trace, attr, None)
+            if data is not None:
+                total += approx_nbytes(data)
+    return total
+
+def cached_figure(key, build):
+    # key = (versión del dataset, filtros, especificación del gráfico); build() solo corre en un fallo
+    cache = session_cache('figure_cache', FIGURE_CACHE_MB * 1024 ** 2)
+    fig = cache.get(key)
+    if fig is None:
+        fig = build()
+        cache.put(key, fig, figure_nbytes(fig))
+    return fig
+
+def file_digest(file) -> str:
+    # El UploadedFile conserva su file_id entre reruns: se evita re-hashear archivos grandes
+    digests = st.session_state.setdefault('file_digests', {})
+    file_id = getattr(file, 'file_id', None)
+    if file_id is not None and file_id in digests:
+        return digests[file_id]
+    # Un archivo dentro de un comprimido se identifica por el comprimido y su ruta, sin descomprimirlo
+    container = getattr(file, 'container', None)
+    with (container or file).getbuffer() as buf:
+        h = hashlib.blake2b(buf, digest_size=16)
+    if container is not None:
+        h.update(file.member.encode())
+    digest = h.hexdigest()
+    if file_id is not None:
+        digests[file_id] = digest
+    return digest
+
 # --- Funciones ---
-def load_file(file) -> pd.DataFrame:
+class ArchiveMember(io.RawIOBase):
+    # Archivo dentro de un .gz/.bz2/.zst o de un .zip, con la interfaz del upload (name, size, file_id).
+    # read() descomprime a medida que se lee; los lectores que necesitan saltar por el archivo
+    # (Excel, Parquet) o getbuffer() lo descomprimen entero en memoria la primera vez
+    def __init__(self, container, name: str, open_stream, size: int, member: str = None):
+        super().__init__()
+        self.container = container
+        self.member = member or name
+        self.name = name
+        self.file_id = f"{getattr(container, 'file_id', container.name)}::{self.member}"
+        # Tamaño descomprimido si el formato lo registra; si no, el comprimido
+        self.size = size
+        self._open = open_stream
+        self._stream = None
+        self._data = None
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._data is not None:
+            return self._data.readinto(b)
+        if self._stream is None:
+            self._stream = self._open()
+        n = self._stream.readinto(b)
+        self._pos += n
+        return n
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        # Volver al inicio reabre el flujo; cualquier otro salto requiere el contenido completo
+        if self._data is None and pos == 0 and whence == 0:
+            self._stream, self._pos = None, 0
+            return 0
+        return self._materialize().seek(pos, whence)
+
+    def tell(self) -> int:
+        return self._data.tell() if self._data is not None else self._pos
+
+    def getbuffer(self):
+        return self._materialize().getbuffer()
+
+    def _materialize(self) -> io.BytesIO:
+        if self._data is None:
+            stream = self._open()
+            self._data = io.BytesIO(stream.read())
+            self._data.seek(self._pos)
+            self._stream = None
+        return self._data
+
+def decompressed_size(file, ext: str) -> int:
+    # gzip guarda el tamaño original (módulo 4 GiB) en sus últimos 4 bytes; zstd, a veces, en la cabecera
+    with file.getbuffer() as buf:
+        if ext == '.gz' and len(buf) >= 4:
+            return max(int.from_bytes(buf[-4:], 'little'), file.size)
+        if ext == '.zst' and HAS_ZSTD:
+            import zstandard
+            size = zstandard.frame_content_size(bytes(buf[:18]))
+            if size > 0:
+                return max(size, file.size)
+        head = bytes(buf[:SIZE_SAMPLE_BYTES])
+    # Sin tamaño registrado (.bz2, .zst en streaming): se extrapola la tasa de compresión del comienzo.
+    # Si el comienzo no alcanza a completar un bloque se asume una tasa típica de texto (10x)
+    if ext == '.bz2':
+        out = bz2.BZ2Decompressor().decompress(head)
+    elif ext == '.zst' and HAS_ZSTD:
+        out = zstandard.ZstdDecompressor().decompressobj().decompress(head)
+    else:
+        return file.size
+    if len(head) == file.size:
+        return max(len(out), file.size)
+    return max(len(out) * file.size // len(head), file.size) if out else 10 * file.size
+
+def open_decompressed(file, ext: str):
+    file.seek(0)
+    if ext == '.gz':
+        return gzip.GzipFile(fileobj=file)
+    if ext == '.bz2':
+        return bz2.BZ2File(file)
+    import zstandard
+    return zstandard.ZstdDecompressor().stream_reader(file)
+
+def expand_upload(file) -> list:
+    # Un upload comprimido se reemplaza por los archivos que contiene (un .zip puede traer varios);
+    # los demás pasan tal cual
+    base, ext = os.path.splitext(file.name)
+    ext = ext.lower()
+    if ext == '.zip':
+        file.seek(0)
+        archive = zipfile.ZipFile(file)
+        return [ArchiveMember(file, os.path.basename(info.filename), lambda info=info: archive.open(info), info.file_size, info.filename)
+                for info in archive.infolist()
+                if not info.is_dir() and not os.path.basename(info.filename).startswith('.') and '__MACOSX' not in info.filename]
+    if ext in COMPRESSED_EXTS:
+        if ext == '.zst' and not HAS_ZSTD:
+            raise ValueError('Se requiere el paquete zstandard para leer archivos .zst')
+        return [ArchiveMember(file, base, lambda: open_decompressed(file, ext), decompressed_size(file, ext))]
+    return [file]
+
+@contextmanager
+def spooled_path(file):
+    # DuckDB lee rutas en paralelo; el upload en memoria se vuelca a un archivo temporal.
+    # Un .gz/.zst se vuelca comprimido: DuckDB lo descomprime al leer
+    ext = os.path.splitext(file.name)[1].lower()
+    source = file
+    container = getattr(file, 'container', None)
+    if container is not None and os.path.splitext(container.name)[1].lower() in ['.gz', '.zst']:
+        source = container
+        ext += os.path.splitext(container.name)[1].lower()
+    tmp = tempfile.NamedTemporaryFile(suffix=ext, delete=False)
+    try:
+        with tmp:
+            if isinstance(source, ArchiveMember):
+                # Miembro de .zip/.bz2: se descomprime directo al archivo, sin pasar entero por memoria
+                source.seek(0)
+                shutil.copyfileobj(source, tmp, 1024 ** 2)
+            else:
+                with source.getbuffer() as buf:
+                    tmp.write(buf)
+        yield tmp.name
+    finally:
+        os.unlink(tmp.name)
+
+def arrow_table(result):
+    # DuckDB >= 1.4 devuelve un RecordBatchReader en .arrow(); versiones previas, una tabla
+    table = result.arrow()
+    return table.read_all() if hasattr(table, 'read_all') else table
+
+def flatten_structs(con, source: str) -> str:
+    # read_json_auto deja los objetos anidados como STRUCT; se aplanan a 'cliente.nombre' como
+    # json_normalize, para que el esquema no dependa del motor de lectura
+    rel = con.sql(f"SELECT * FROM {source} LIMIT 0")
+
+    def expand(expr, name, dtype):
+        if dtype.id != 'struct':
+            return [f"{expr} AS {qi(name)}"]
+        return [item for field, child in dtype.children
+                for item in expand(f"struct_extract({expr}, '{field.replace(chr(39), chr(39) * 2)}')", f"{name}.{field}", child)]
+
+    if not any(t.id == 'struct' for t in rel.types):
+        return source
+    cols = [item for name, dtype in zip(rel.columns, rel.types) for item in expand(qi(name), name, dtype)]
+    return f"(SELECT {', '.join(cols)} FROM {source})"
+
+def duckdb_source(path: str, con=None) -> str:
+    # Lectores nativos de DuckDB (multihilo, con detección de tipos y de compresión .gz/.zst).
+    # Con con, el JSON anidado sale aplanado (ver flatten_structs)
+    base, ext = os.path.splitext(path)
+    if ext.lower() in ['.gz', '.zst']:
+        ext = os.path.splitext(base)[1]
+    ext = ext.lower()
+    literal = "'" + path.replace("'", "''") + "'"
+    if ext == '.csv':
+        return f"read_csv_auto({literal}, buffer_size={DUCKDB_CSV_BUFFER})"
+    if ext in JSON_EXTS:
+        source = f"read_json_auto({literal})"
+        return flatten_structs(con, source) if con is not None else source
+    if ext == '.parquet':
+        return f"read_parquet({literal})"
+    raise ValueError(f'Extensión {ext} no soportada por el motor duckdb')
+
+def load_file(file, engine: str = 'pandas', dtype_backend: str = None, **options) -> pd.DataFrame:
+    # dtype_backend='pyarrow': columnas respaldadas por Arrow en lugar de objetos Python
     ext = os.path.splitext(file.name)[1].lower()
+    if engine == 'duckdb' and ext in ['.csv', '.parquet'] + JSON_EXTS:
+        select = ', '.join(qi(c) for c in options['columns']) if options.get('columns') else '*'
+        with spooled_path(file) as path:
+            con = duckdb.connect()
+            rel = con.sql(f"SELECT {select} FROM {duckdb_source(path, con)}")
+            # DATE → TIMESTAMP, como en standardized_select: con Arrow llegaría como date32 y no como fecha-hora
+            dates = [c for c, t in zip(rel.columns, rel.types) if t.id == 'date']
+            if dates:
+                rel = rel.select(', '.join(f"CAST({qi(c)} AS TIMESTAMP) AS {qi(c)}" if c in dates else qi(c) for c in rel.columns))
+            if dtype_backend != 'pyarrow':
+                return rel.df()
+            return arrow_table(rel).to_pandas(types_mapper=pd.ArrowDtype)
+    if dtype_backend:
+        options['dtype_backend'] = dtype_backend
     if ext == '.csv':
-        df = pd.read_csv(file)
+        df = pd.read_csv(file, **options)
     elif ext in ['.xls', '.xlsx']:
-        df = pd.read_excel(file)
-    elif ext == '.json':
-        data = json.load(file)
-        df = pd.json_normalize(data)
+        df = pd.read_excel(file, engine=excel_engine(ext), **options)
+    elif ext in ARROW_EXTS:
+        table = read_arrow_file(file, options.get('columns'))
+        if dtype_backend == 'pyarrow':
+            df = table.to_pandas(types_mapper=pd.ArrowDtype)
+        else:
+            df = table.to_pandas(split_blocks=True)
+    elif ext in JSON_EXTS:
+        # Se normaliza por lotes: nunca está el documento completo como objetos Python
+        options.pop('dtype_backend', None)
+        chunks = list(iter_json_chunks(file, **options))
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+        if dtype_backend:
+            df = df.convert_dtypes(dtype_backend=dtype_backend)
     else:
         raise ValueError(f'Extensión {ext} no soportada')
     return df
 
+def read_arrow_file(file, columns: tuple = None):
+    # El búfer del upload se lee en el lugar (sin copia); Parquet solo decodifica las columnas pedidas
+    # e IPC/Feather sin comprimir quedan apuntando al mismo búfer
+    if not HAS_PYARROW:
+        raise ValueError('Se requiere pyarrow para leer Parquet, Arrow y Feather')
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    ext = os.path.splitext(file.name)[1].lower()
+    buf = pa.py_buffer(file.getbuffer())
+    columns = list(columns) if columns else None
+    if ext == '.parquet':
+        return pq.read_table(pa.BufferReader(buf), columns=columns)
+    try:
+        return feather.read_table(pa.BufferReader(buf), columns=columns)
+    except pa.ArrowInvalid:
+        # Arrow IPC en formato stream (sin pie de archivo)
+        table = pa.ipc.open_stream(buf).read_all()
+        return table.select(columns) if columns else table
+
+def arrow_columns(file) -> list:
+    # Parquet: desde el esquema del pie, sin leer datos
+    if os.path.splitext(file.name)[1].lower() == '.parquet' and HAS_PYARROW:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        return pq.read_schema(pa.BufferReader(pa.py_buffer(file.getbuffer()))).names
+    return read_arrow_file(file).column_names
+
+def excel_engine(ext: str) -> str:
+    # openpyxl no lee .xls: sin calamine, pandas elige el lector (xlrd)
+    return EXCEL_ENGINE if ext == '.xlsx' or EXCEL_ENGINE == 'calamine' else None
+
+def excel_sheets(file) -> list:
+    ext = os.path.splitext(file.name)[1].lower()
+    file.seek(0)
+    with pd.ExcelFile(file, engine=excel_engine(ext)) as book:
+        return book.sheet_names
+
+def iter_excel_chunks(file, chunksize: int = CSV_CHUNK_ROWS, sheet_name: str = None):
+    # openpyxl en modo solo lectura recorre el XML de la hoja fila a fila, sin cargarla completa
+    file.seek(0)
+    book = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = (book[sheet_name] if sheet_name else book.active).iter_rows(values_only=True)
+        header = next(rows, None)
+        while header is not None:
+            batch = list(islice(rows, chunksize))
+            if not batch:
+                break
+            yield pd.DataFrame.from_records(batch, columns=header)
+    finally:
+        book.close()
+
+def iter_json_records(file, block_size: int = JSON_BLOCK_BYTES):
+    # Registros de un arreglo JSON de nivel superior, de NDJSON o de un único objeto,
+    # decodificados uno a uno desde bloques de texto con raw_decode
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+    buf, pos, eof, in_array = '', 0, False, None
+    while True:
+        # Separadores entre registros: espacios, saltos de línea y, dentro del arreglo, comas
+        while pos < len(buf) and (buf[pos].isspace() or (in_array and buf[pos] == ',')):
+            pos += 1
+        if pos < len(buf) and in_array is None:
+            in_array = buf[pos] == '['
+            pos += in_array
+            continue
+        if in_array and buf[pos:pos + 1] == ']':
+            return
+        end = None
+        if pos < len(buf):
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        # Sin registro completo en el búfer, o uno que termina en el borde (un número puede seguir)
+        if end is None or (end == len(buf) and not eof):
+            if eof:
+                return
+            block = file.read(block_size)
+            eof = not block
+            buf = buf[pos:] + utf8.decode(block, final=eof)
+            pos = 0
+            continue
+        yield record
+        pos = end
+
+def iter_json_chunks(file, chunksize: int = JSON_CHUNK_ROWS, **options):
+    # Lotes de registros aplanados con json_normalize (columnas anidadas → 'a.b')
+    records = iter_json_records(file)
+    while True:
+        batch = list(islice(records, chunksize))
+        if not batch:
+            break
+        yield pd.json_normalize(batch, **options)
+
+def iter_chunks(file, chunksize: int = CSV_CHUNK_ROWS, invalid_dates: dict = None, **options):
+    # Bloques de tamaño fijo ya estandarizados: la memoria no depende del tamaño del archivo.
+    # El formato de cada fecha se infiere en el primer bloque y se reutiliza en los siguientes
+    ext = os.path.splitext(file.name)[1].lower()
+    if ext == '.xlsx':
+        chunks = iter_excel_chunks(file, chunksize, **options)
+    elif ext in JSON_EXTS:
+        chunks = iter_json_chunks(file, min(chunksize, JSON_CHUNK_ROWS), **options)
+    else:
+        chunks = pd.read_csv(file, chunksize=chunksize, **options)
+    formats = {}
+    for chunk in chunks:
+        chunk, invalid = normalize_dates(standardize_columns(chunk), formats)
+        if invalid_dates is not None:
+            for c, n in invalid.items():
+                invalid_dates[c] = invalid_dates.get(c, 0) + n
+        yield fill_unknown(chunk)
+
+def standardized_select(con, source: str, formats: dict = None) -> str:
+    # Equivalente SQL de standardize_columns + normalize_dates + relleno 'Desconocido'.
+    # DATE y DECIMAL se llevan a TIMESTAMP y DOUBLE, los tipos que producen los caminos pandas,
+    # para que la misma fila tenga el mismo tipo (y el mismo hash) sin importar cómo se cargó.
+    # formats: recibe el formato inferido de cada columna de fecha
+    described = con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()
+    names = standardize_columns(pd.DataFrame(columns=[r[0] for r in described])).columns
+    cols = []
+    for (orig, dtype, *_), new in zip(described, names):
+        expr = qi(orig)
+        if dtype == 'DATE':
+            expr = f"CAST({qi(orig)} AS TIMESTAMP)"
+        elif dtype.startswith('DECIMAL'):
+            expr = f"CAST({qi(orig)} AS DOUBLE)"
+        elif dtype == 'VARCHAR' and any(k in new for k in DATE_KEYWORDS):
+            sample = con.execute(f"SELECT {qi(orig)} FROM {source} WHERE {qi(orig)} IS NOT NULL LIMIT {DATE_SAMPLE_ROWS}").df()
+            fmt = infer_date_format(sample[orig])
+            if fmt:
+                if formats is not None:
+                    formats[orig] = fmt
+                expr = f"try_strptime({qi(orig)}, '{fmt}')"
+        if expr == qi(orig) and dtype == 'VARCHAR':
+            expr = f"COALESCE({qi(orig)}, 'Desconocido')"
+        cols.append(f"{expr} AS {qi(new)}")
+    return ', '.join(cols)
+
+def parse_key(file, options: dict) -> tuple:
+    # Clave: contenido del archivo + extensión + opciones de lectura, no el nombre
+    ext = os.path.splitext(file.name)[1].lower()
+    return (file_digest(file), ext, tuple(sorted(options.items())))
+
+def load_file_cached(file, **options) -> pd.DataFrame:
+    key = ('lectura',) + parse_key(file, options)
+    cache = data_cache()
+    df = cache.get(key)
+    if df is None:
+        file.seek(0)
+        df = load_file(file, **options)
+        cache.put(key, df, frame_nbytes(df))
+    return df
+
+def needs_chunked(file) -> bool:
+    # Archivos que no se cargan en memoria sino por bloques al almacén
+    ext = os.path.splitext(file.name)[1].lower()
+    return (ext in ['.csv'] + JSON_EXTS and file.size > CHUNKED_CSV_MB * 1024 ** 2
+            or ext == '.xlsx' and file.size > CHUNKED_EXCEL_MB * 1024 ** 2)
+
+def prefetch_files(files: list, options: dict, compact: bool = False, progress=None) -> dict:
+    # Lee y prepara en paralelo (fechas, nulos, hashes, duplicados internos) los archivos que aún no
+    # están en la caché de parseo; devuelve {clave: excepción} de los que fallaron para informarlos
+    # por archivo. Hilos y no procesos: el lector C de pandas, pyarrow, DuckDB y el hash de numpy
+    # sueltan el GIL, y las funciones de este script (que corre como __main__) no se pueden enviar
+    # a otro proceso. La caché y st.* se usan solo desde el hilo principal
+    cache = data_cache()
+    pending = {}
+    for file in files:
+        key = parse_key(file, options)
+        if ('lectura',) + key not in cache:
+            pending[key] = file
+    errors = {}
+    if len(pending) < 2:
+        return errors
+
+    def read(file):
+        file.seek(0)
+        df = load_file(file, **options)
+        return df, prepare_table(df, compact)
+
+    with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+        futures = {pool.submit(read, file): key for key, file in pending.items()}
+        for done, future in enumerate(as_completed(futures), 1):
+            key = futures[future]
+            try:
+                df, result = future.result()
+                cache.put(('lectura',) + key, df, frame_nbytes(df))
+                cache.put(('preparado',) + key + (compact,), result, frame_nbytes(result[0], df) + result[1].nbytes)
+            except Exception as e:
+                errors[key] = e
+            if progress:
+                progress(done / len(futures), f"Leído {pending[key].name} ({done}/{len(futures)})")
+    return errors
+
 def standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    # Copia superficial: solo cambian los nombres, los datos se comparten con el original
+    df = df.copy(deep=False)
     df.columns = (
         df.columns
         .astype(str)
@@ -34,163 +644,986 @@ def standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
     )
     return df
 
-def clean_table(df: pd.DataFrame, table_type: str = None) -> Tuple[pd.DataFrame, dict]:
+def text_columns(df: pd.DataFrame) -> list:
+    # object, string y string[pyarrow]; las categóricas quedan fuera
+    return [c for c, t in df.dtypes.items() if t == object or pd.api.types.is_string_dtype(t)]
+
+def date_columns(df: pd.DataFrame) -> list:
+    # Texto con nombre de fecha; las columnas ya tipadas (Excel, JSON con fechas ISO) no se tocan
+    return [c for c in text_columns(df) if any(k in c for k in DATE_KEYWORDS)]
+
+def infer_date_format(values: pd.Series, min_rate: float = DATE_MIN_PARSE_RATE) -> str:
+    # Gana el formato que interpreta más valores de una muestra; None si ninguno llega a min_rate
+    # (una columna 'fecha_nota' con texto libre no se convierte ni pierde sus valores)
+    sample = values.dropna()
+    if len(sample) > DATE_SAMPLE_ROWS:
+        sample = sample.sample(DATE_SAMPLE_ROWS, random_state=0)
+    best, best_ok = None, 0
+    for fmt in ISO_DATE_FORMATS + DATE_FORMATS:
+        ok = int(pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum())
+        if ok > best_ok:
+            best, best_ok = fmt, ok
+    if not len(sample) or best_ok < min_rate * len(sample):
+        return None
+    return best
+
+def normalize_dates(df: pd.DataFrame, formats: dict = None) -> Tuple[pd.DataFrame, dict]:
+    # Texto → datetime con un formato explícito por columna (sin inferencia fila a fila).
+    # formats: formatos ya inferidos (p. ej. en el bloque anterior); se completa en el lugar.
+    # Devuelve las filas con fecha no interpretable por columna
+    formats = {} if formats is None else formats
+    invalid = {}
+    for c in date_columns(df) + [c for c in formats if c in df.columns and c not in text_columns(df)]:
+        if c not in formats:
+            formats[c] = infer_date_format(df[c])
+        if formats[c] is None or pd.api.types.is_datetime64_any_dtype(df[c]):
+            continue
+        parsed = pd.to_datetime(df[c], format=formats[c], errors='coerce')
+        invalid[c] = int((parsed.isna() & df[c].notna()).sum())
+        df[c] = parsed
+    return df, invalid
+
+def fill_unknown(df: pd.DataFrame) -> pd.DataFrame:
+    for c in text_columns(df):
+        if df[c].hasnans:
+            df[c] = df[c].fillna('Desconocido')
+    return df
+
+def compact_text_columns(df: pd.DataFrame, max_ratio: float = CATEGORY_MAX_RATIO) -> pd.DataFrame:
+    # Texto con pocos valores distintos (producto, local, región) se guarda como diccionario
+    for c in text_columns(df):
+        if len(df) and df[c].nunique(dropna=False) <= max_ratio * len(df):
+            df[c] = df[c].astype('category')
+    return df
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    # before/after con las mismas columnas en el mismo orden (p. ej. crudo vs limpio)
+    after_bytes = after.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'bytes_antes': before.memory_usage(deep=True, index=False).to_numpy(),
+        'bytes_despues': after_bytes.to_numpy(),
+    }, index=after_bytes.index)
+    report.loc['total'] = report.sum()
+    report['ahorro_%'] = (100 * (1 - report['bytes_despues'] / report['bytes_antes'])).round(1)
+    return report
+
+def is_scalar_value(value) -> bool:
+    return not isinstance(value, (dict, list, tuple, set, np.ndarray))
+
+def hashable_values(values: pd.Series) -> pd.Series:
+    # Listas u objetos (JSON anidado) no son hasheables: entran por su forma JSON, igual sin
+    # importar si llegaron como list, ndarray (DuckDB) o columna Arrow anidada
+    arrow_type = getattr(values.dtype, 'pyarrow_dtype', None)
+    nested = arrow_type is not None and arrow_type.num_fields > 0
+    if not nested and (values.dtype != object or values.map(is_scalar_value).all()):
+        return values
+    as_json = lambda v: json.dumps(v, sort_keys=True, default=lambda o: o.tolist() if hasattr(o, 'tolist') else str(o))
+    return values.astype(object).map(lambda v: v if is_scalar_value(v) else as_json(v))
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    # Hash de 64 bits por fila (nombres y valores), independiente del orden de las columnas.
+    # Lo calcula DuckDB por bloques sobre el DataFrame registrado: sin arreglos temporales
+    # del tamaño de la tabla por cada columna. Las resoluciones de fecha y los FLOAT se llevan
+    # a un solo tipo para que el mismo valor tenga el mismo hash sin importar el lector
+    frame = df.copy(deep=False)
+    for c in frame.columns:
+        values = hashable_values(frame[c])
+        if values is not frame[c]:
+            frame[c] = values
+    con = duckdb.connect()
+    con.register('filas', as_scannable(frame))
+    types = column_types(con, 'filas')
+    args = []
+    for c in sorted(frame.columns, key=str):
+        expr = qi(str(c))
+        if types[str(c)] in ('TIMESTAMP_NS', 'TIMESTAMP_MS', 'TIMESTAMP_S'):
+            expr = f"CAST({expr} AS TIMESTAMP)"
+        elif types[str(c)] == 'FLOAT':
+            expr = f"CAST({expr} AS DOUBLE)"
+        # El nombre entra al hash: mismos valores bajo otro esquema no son la misma fila
+        args += ["'" + str(c).replace("'", "''") + "'", expr]
+    if not args:
+        return np.zeros(len(df), dtype=np.uint64)
+    return con.execute(f"SELECT hash({', '.join(args)}) AS h FROM filas").fetchnumpy()['h']
+
+def prepare_table(df: pd.DataFrame, compact: bool = False) -> Tuple[pd.DataFrame, np.ndarray, dict]:
+    # Limpieza que depende solo del archivo: se puede correr en paralelo para varios archivos.
+    # Fechas y nulos se normalizan antes del hash: la misma fila leída de formatos distintos
+    # (CSV con fecha tipada, JSON con fecha en texto) se reconoce como duplicada.
+    # Devuelve las filas sin duplicados internos y sus hashes
     df = standardize_columns(df)
+    df, invalid_dates = normalize_dates(df)
+    df = fill_unknown(df)
     before_rows = len(df)
-    df = df.drop_duplicates()
-    obj_cols = df.select_dtypes(include=['object', 'string']).columns
-    for c in obj_cols:
-        df[c] = df[c].fillna('Desconocido')
-    after_rows = len(df)
+    hashes = row_hashes(df)
+    keep = ~pd.Series(hashes).duplicated().to_numpy()
+    if not keep.all():
+        df = df[keep]
+        hashes = hashes[keep]
+    if compact:
+        df = compact_text_columns(df)
     report = {
         'rows_before': before_rows,
-        'rows_after': after_rows,
-        'deduplicated': before_rows - after_rows
+        'deduplicated': before_rows - len(df),
+        'unparseable_dates': invalid_dates
+    }
+    return df, hashes, report
+
+def drop_seen(df: pd.DataFrame, hashes: np.ndarray, report: dict, seen: list = None) -> Tuple[pd.DataFrame, dict]:
+    # seen: hashes de las filas ya aceptadas en otros archivos del área; se actualiza en el lugar.
+    # Es el único paso secuencial: depende de los archivos anteriores
+    cross_file = 0
+    if seen:
+        known = np.isin(hashes, np.concatenate(seen))
+        cross_file = int(known.sum())
+        if cross_file:
+            df = df[~known]
+            hashes = hashes[~known]
+    if seen is not None:
+        seen.append(hashes)
+    report = {
+        'rows_before': report['rows_before'],
+        'rows_after': len(df),
+        'deduplicated': report['deduplicated'],
+        'cross_file_duplicates': cross_file,
+        'unparseable_dates': report['unparseable_dates']
     }
     return df, report
 
-# --- Streamlit UI ---
-st.title("🚀 Generador de Dashboards Interactivos")
-st.write("Sube tus archivos Excel, CSV o JSON para generar dashboards automáticamente.")
+def clean_table(df: pd.DataFrame, table_type: str = None, compact: bool = False, seen: list = None) -> Tuple[pd.DataFrame, dict]:
+    df, hashes, report = prepare_table(df, compact)
+    return drop_seen(df, hashes, report, seen)
+
+def prepare_table_cached(file, df: pd.DataFrame, options: dict, compact: bool) -> Tuple[pd.DataFrame, np.ndarray, dict]:
+    key = ('preparado',) + parse_key(file, options) + (compact,)
+    cache = data_cache()
+    hit = cache.get(key)
+    if hit is None:
+        hit = prepare_table(df, compact)
+        cache.put(key, hit, frame_nbytes(hit[0], df) + hit[1].nbytes)
+    return hit
+
+def clean_table_cached(file, df: pd.DataFrame, options: dict, area: str, compact: bool, seen: list, prior: tuple) -> Tuple[pd.DataFrame, dict]:
+    # prior: archivos anteriores del área; si cambian, cambia la deduplicación entre archivos
+    key = ('limpio',) + parse_key(file, options) + (area, compact, prior)
+    cache = data_cache()
+    hit = cache.get(key)
+    if hit is None:
+        prepared = prepare_table_cached(file, df, options, compact)
+        df_clean, report = drop_seen(*prepared, seen)
+        cache.put(key, (df_clean, report, seen[-1]), frame_nbytes(df_clean, prepared[0]) + seen[-1].nbytes)
+        return df_clean, report
+    df_clean, report, hashes = hit
+    seen.append(hashes)
+    return df_clean, report
+
+def prefix_index(values: list) -> Tuple[np.ndarray, np.ndarray]:
+    # Valores ordenados por su texto en minúsculas: los que comparten prefijo quedan contiguos
+    keys = np.array([str(v).lower() for v in values], dtype=object)
+    order = np.argsort(keys, kind='stable')
+    return keys[order], np.array(values, dtype=object)[order]
 
-uploaded_files = st.file_uploader("Sube tus archivos", type=['csv','xlsx','xls','json'], accept_multiple_files=True)
+def prefix_range(index: tuple, prefix: str) -> Tuple[int, int]:
+    # Dos búsquedas binarias en lugar de recorrer todos los valores
+    keys, _ = index
+    prefix = prefix.lower()
+    lo = int(np.searchsorted(keys, prefix, 'left'))
+    hi = int(np.searchsorted(keys, prefix + '\U0010ffff', 'left'))
+    return lo, hi
 
-if uploaded_files:
-    datasets = {}
-    for file in uploaded_files:
-        st.subheader(f"Procesando: {file.name}")
+# --- Consultas DuckDB ---
+def qi(col: str) -> str:
+    # Identificador SQL entre comillas (las columnas vienen del usuario)
+    return '"' + str(col).replace('"', '""') + '"'
+
+def build_where(filters: dict) -> Tuple[str, list]:
+    # filters: {columna: [valores]}; las listas vacías no filtran
+    clauses, params = [], []
+    for col, values in filters.items():
+        if values:
+            clauses.append(f"{qi(col)} IN ({', '.join(['?'] * len(values))})")
+            params.extend(values)
+    where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+    return where, params
+
+def column_types(con, table: str) -> dict:
+    return dict(con.execute(f"SELECT column_name, column_type FROM (DESCRIBE {qi(table)})").fetchall())
+
+def date_expr(con, table: str, col: str) -> str:
+    # Las fechas en texto se interpretan con los formatos habituales (día primero)
+    dtype = column_types(con, table)[col]
+    if 'TIMESTAMP' in dtype or dtype == 'DATE':
+        return f"CAST({qi(col)} AS TIMESTAMP)"
+    formats = ', '.join(f"'{f}'" for f in DATE_FORMATS)
+    return f"COALESCE(TRY_CAST({qi(col)} AS TIMESTAMP), try_strptime(CAST({qi(col)} AS VARCHAR), [{formats}]))"
+
+def date_parse_rate(values: pd.Series, dtype: str) -> float:
+    # Fracción de los valores no nulos que se interpretan como fecha
+    if 'TIMESTAMP' in dtype or dtype == 'DATE':
+        return 1.0
+    if dtype != 'VARCHAR' or values.empty:
+        return 0.0
+    fmt = infer_date_format(values, min_rate=0)
+    if fmt is None:
+        return 0.0
+    return float(pd.to_datetime(values, format=fmt, errors='coerce').notna().mean())
+
+def detect_roles(con, table: str) -> dict:
+    # Puntaje por nombre, tipo, cardinalidad y tasa de fechas válidas sobre una muestra de la tabla.
+    # Cada columna cubre a lo sumo un rol; None si ningún candidato califica
+    types = column_types(con, table)
+    sample = con.execute(f"SELECT * FROM {qi(table)} USING SAMPLE reservoir({ROLE_SAMPLE_ROWS} ROWS) REPEATABLE (42)").df()
+    scores = {role: {} for role in ROLE_KEYWORDS}
+    for c, dtype in types.items():
+        # Listas u objetos anidados no cumplen ningún rol
+        if dtype.endswith(']') or dtype.startswith(('STRUCT', 'MAP', 'UNION')):
+            continue
+        values = sample[c].dropna()
+        named = {role: any(k in c for k in keywords) for role, keywords in ROLE_KEYWORDS.items()}
+        numeric = dtype in NUMERIC_TYPES or dtype.startswith('DECIMAL')
+        distinct_ratio = values.nunique() / max(len(values), 1)
+        rate = date_parse_rate(values, dtype)
+        if rate >= DATE_MIN_PARSE_RATE or (named['fecha'] and rate >= 0.5):
+            scores['fecha'][c] = 2 * named['fecha'] + rate
+        if named['monto'] and numeric:
+            # Un monto tiene muchos valores distintos; un código o una cantidad, pocos
+            scores['monto'][c] = 2 + distinct_ratio
+        for role in DIMENSION_ROLES:
+            if named[role] and rate < DATE_MIN_PARSE_RATE and dtype not in ('FLOAT', 'DOUBLE'):
+                scores[role][c] = 2 + (dtype == 'VARCHAR') + (1 - distinct_ratio)
+    roles, taken = {}, set()
+    for role, candidates in scores.items():
+        candidates = {c: v for c, v in candidates.items() if c not in taken}
+        roles[role] = max(candidates, key=candidates.get) if candidates else None
+        taken.add(roles[role])
+    return roles
+
+def create_base_view(con, table: str, col_fecha: str) -> None:
+    fecha = date_expr(con, table, col_fecha)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP VIEW ventas_base AS
+        SELECT * REPLACE ({fecha} AS {qi(col_fecha)}), year({fecha}) AS "año"
+        FROM {qi(table)}
+        WHERE {fecha} IS NOT NULL
+    """)
+
+def cube_keys(col_fecha: str, dims: list) -> list:
+    return ['"año"', f'month({qi(col_fecha)})'] + [qi(d) for d in dims]
+
+def cube_select(col_fecha: str, dims: list) -> str:
+    keys = cube_keys(col_fecha, dims)
+    keys[1] += ' AS "mes"'
+    return ', '.join(keys)
+
+def build_cube(con, col_fecha: str, col_monto: str, dims: list):
+    # Suma del monto por (año, mes, producto, local, región); los gráficos y filtros se responden desde aquí.
+    # Se devuelve como tabla Arrow para no convertir el texto a objetos Python.
+    # Si casi no agrupa (muchas combinaciones), el cubo sería otra copia de los datos: devuelve None
+    filas, grupos = con.execute(f"""
+        SELECT COUNT(*), approx_count_distinct(hash({', '.join(cube_keys(col_fecha, dims))}))
+        FROM ventas_base
+    """).fetchone()
+    if grupos > CUBE_MAX_RATIO * filas:
+        return None
+    result = con.execute(f"""
+        SELECT {cube_select(col_fecha, dims)}, SUM({qi(col_monto)}) AS {qi(col_monto)}, COUNT(*) AS filas
+        FROM ventas_base
+        GROUP BY ALL
+    """)
+    return arrow_table(result) if HAS_PYARROW else result.df()
+
+def cached_cube(con, version: tuple, col_fecha: str, col_monto: str, dims: list):
+    # Un cubo que no entra en su presupuesto se descarta (None: vista sobre ventas_base) y esa
+    # decisión también queda guardada, para no repetir los recorridos de build_cube en cada rerun
+    cache = session_cache('cube_cache', CUBE_CACHE_MB * 1024 ** 2)
+    key = (version, col_fecha, col_monto, tuple(dims))
+    if key not in cache:
+        cubo = build_cube(con, col_fecha, col_monto, dims)
+        nbytes = approx_nbytes(cubo) if cubo is not None else 0
+        if nbytes > cache.max_bytes:
+            cubo, nbytes = None, 0
+        cache.put(key, cubo, nbytes)
+        return cubo
+    return cache.get(key)
+
+def register_cube(con, cubo, col_fecha: str, col_monto: str, dims: list) -> None:
+    # ventas_cube apunta al cubo o, si no se construyó, directo a ventas_base con las mismas columnas
+    if cubo is not None:
+        con.register('ventas_cube_datos', as_scannable(cubo))
+        source = 'SELECT * FROM ventas_cube_datos'
+    else:
+        source = f'SELECT {cube_select(col_fecha, dims)}, {qi(col_monto)}, 1 AS filas FROM ventas_base'
+    con.execute(f"CREATE OR REPLACE TEMP VIEW ventas_cube AS {source}")
+
+def segment_options(con, columns: list) -> dict:
+    # Diccionario de valores de todas las columnas de segmentación en una sola pasada
+    select = ', '.join(f"list_sort(list(DISTINCT {qi(c)}))" for c in columns)
+    row = con.execute(f"SELECT {select} FROM ventas_cube").fetchone()
+    return dict(zip(columns, row))
+
+def query_total(con, col_monto: str, filters: dict) -> float:
+    where, params = build_where(filters)
+    total = con.execute(f"SELECT SUM({qi(col_monto)}) FROM ventas_cube {where}", params).fetchone()[0]
+    return total or 0
+
+def query_trend(con, col_fecha: str, col_monto: str, filters: dict) -> pd.DataFrame:
+    where, params = build_where(filters)
+    return con.execute(f"""
+        SELECT make_date("año", "mes", 1) AS {qi(col_fecha)}, SUM({qi(col_monto)}) AS {qi(col_monto)}
+        FROM ventas_cube {where}
+        GROUP BY 1 ORDER BY 1
+    """, params).df()
+
+def query_by(con, col: str, col_monto: str, filters: dict, limit: int = None) -> pd.DataFrame:
+    where, params = build_where(filters)
+    limit_sql = f'LIMIT {int(limit)}' if limit else ''
+    return con.execute(f"""
+        SELECT {qi(col)}, SUM({qi(col_monto)}) AS {qi(col_monto)}
+        FROM ventas_cube {where}
+        GROUP BY 1 ORDER BY 2 DESC {limit_sql}
+    """, params).df()
+
+def query_top(con, col: str, col_monto: str, filters: dict, n: int = TOP_N) -> pd.DataFrame:
+    # ORDER BY ... LIMIT usa el operador top-N de DuckDB (un heap de n filas, sin ordenar todos
+    # los grupos); la suma del resto de los grupos va en una fila 'Otros' al final
+    where, params = build_where(filters)
+    return con.execute(f"""
+        WITH grupos AS (
+            SELECT {qi(col)} AS k, SUM({qi(col_monto)}) AS m FROM ventas_cube {where} GROUP BY 1
+        ), top AS (
+            SELECT * FROM grupos ORDER BY m DESC LIMIT {int(n)}
+        )
+        SELECT k AS {qi(col)}, m AS {qi(col_monto)} FROM (
+            SELECT CAST(k AS VARCHAR) AS k, m, 0 AS orden FROM top
+            UNION ALL
+            SELECT 'Otros', (SELECT SUM(m) FROM grupos) - (SELECT SUM(m) FROM top), 1
+            WHERE (SELECT COUNT(*) FROM grupos) > {int(n)}
+        ) ORDER BY orden, m DESC
+    """, params).df()
+
+def custom_value_name(agg: str, col_y: str) -> str:
+    # Nombre propio para el agregado: no choca con X cuando X e Y son la misma columna
+    return f"{agg} de {col_y}"
+
+def query_custom(con, col_x: str, col_y: str, agg: str, filters: dict, max_points: int = MAX_CHART_POINTS) -> pd.DataFrame:
+    # Un punto por valor de X agregado en DuckDB; fechas y números se agrupan en intervalos si exceden el tope.
+    # El texto se queda con los max_points valores de mayor agregado.
+    # El agregado sale en la columna custom_value_name(agg, col_y)
+    where, params = build_where(filters)
+    dtype = column_types(con, 'ventas_base')[col_x]
+    x, y = qi(col_x), qi(col_y)
+    value = f"{AGGREGATIONS[agg]}({y}) AS {qi(custom_value_name(agg, col_y))}"
+    is_date = dtype == 'DATE' or dtype.startswith('TIMESTAMP')
+    if is_date or dtype in NUMERIC_TYPES or dtype.startswith('DECIMAL'):
+        lo, hi, distinct = con.execute(
+            f"SELECT min({x}), max({x}), approx_count_distinct({x}) FROM ventas_base {where}", params).fetchone()
+        bucket = x
+        if distinct and distinct > max_points:
+            if is_date:
+                # date_trunc agrega hasta dos intervalos parciales en los extremos del rango
+                days = (hi - lo).days
+                grain = next((g for g, d in DATE_GRAINS if days / d + 2 <= max_points), 'year')
+                bucket = f"date_trunc('{grain}', {x})"
+            else:
+                # El máximo cae en el último intervalo, no en uno extra
+                lo, width = float(lo), (float(hi) - float(lo)) / max_points
+                bucket = f"{lo!r} + least(floor(({x} - {lo!r}) / {width!r}), {int(max_points) - 1}) * {width!r}"
+        # Ejes agrupados en intervalos: sin LIMIT, que descartaría los extremos
+        order, limit = "ORDER BY 1", ""
+    else:
+        bucket, order, limit = x, "ORDER BY 2 DESC", f"LIMIT {int(max_points)}"
+    return con.execute(f"""
+        SELECT {bucket} AS {x}, {value}
+        FROM ventas_base {where}
+        GROUP BY 1 {order}
+        {limit}
+    """, params).df()
+
+def query_distinct(con, col: str, filters: dict) -> int:
+    where, params = build_where(filters)
+    return con.execute(f"SELECT COUNT(DISTINCT {qi(col)}) FROM ventas_base {where}", params).fetchone()[0]
+
+def query_sample(con, col_x: str, col_y: str, filters: dict, max_points: int = SCATTER_MAX_POINTS) -> pd.DataFrame:
+    # Muestra reservorio reproducible de las filas filtradas
+    where, params = build_where(filters)
+    cols = ', '.join(qi(c) for c in dict.fromkeys([col_x, col_y]))
+    return con.execute(f"""
+        SELECT {cols} FROM (SELECT {cols} FROM ventas_base {where})
+        USING SAMPLE reservoir({int(max_points)} ROWS) REPEATABLE (42)
+    """, params).df()
+
+def profile_table(con, table: str, top_k: int = 5) -> pd.DataFrame:
+    # SUMMARIZE recorre la tabla una sola vez: nulos, distintos aproximados (HyperLogLog),
+    # mín/máx, promedio y cuantiles aproximados; los valores más frecuentes salen de una segunda pasada
+    profile = con.execute(f"SUMMARIZE {qi(table)}").df()
+    profile['nulos'] = (profile['count'] * profile['null_percentage'].astype(float) / 100).round().astype('int64')
+    top = ', '.join(f"approx_top_k({qi(c)}, {int(top_k)})" for c in profile['column_name'])
+    profile[f'top_{top_k}'] = [', '.join(map(str, v or [])) for v in con.execute(f"SELECT {top} FROM {qi(table)}").fetchone()]
+    return profile.set_index('column_name')
+
+def as_scannable(df):
+    # Con texto respaldado por Arrow se registra la tabla Arrow (sin copia); si hay object, el DataFrame
+    if not isinstance(df, pd.DataFrame) or not HAS_PYARROW or any(t == object for t in df.dtypes):
+        return df
+    import pyarrow as pa
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def register_union(con, name: str, frames: list) -> None:
+    # Varios archivos de un área como una sola vista, sin pd.concat
+    if len(frames) == 1:
+        con.register(name, as_scannable(frames[0]))
+        return
+    parts = []
+    for i, df in enumerate(frames):
+        con.register(f"{name}_{i}", as_scannable(df))
+        parts.append(f"SELECT * FROM {qi(f'{name}_{i}')}")
+    con.execute(f"CREATE OR REPLACE TEMP VIEW {qi(name)} AS " + ' UNION ALL BY NAME '.join(parts))
+
+# --- Reducción de puntos ---
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: por cubeta, el punto que forma el triángulo de mayor área
+    # con el punto elegido antes y el promedio de la cubeta siguiente
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    # Mínimo y máximo de cada cubeta: conserva la envolvente completa de la serie
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    edges = np.linspace(0, n, (n_out - 2) // 2 + 1).astype(np.int64)
+    idx = [0, n - 1]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            idx += [start + int(y[start:end].argmin()), start + int(y[start:end].argmax())]
+    return np.unique(idx)
+
+def downsample(df: pd.DataFrame, col_x: str, col_y: str, max_points: int = LINE_POINT_BUDGET, method: str = 'LTTB') -> pd.DataFrame:
+    # df ordenado por X; fechas y números se usan como eje, el resto por posición
+    df = df.dropna(subset=[col_y])
+    if len(df) <= max_points:
+        return df
+    x = df[col_x]
+    if pd.api.types.is_datetime64_any_dtype(x):
+        x = x.to_numpy().astype('datetime64[ns]').astype(np.int64).astype(float)
+    elif pd.api.types.is_numeric_dtype(x):
+        x = x.to_numpy(dtype=float)
+    else:
+        x = np.arange(len(df), dtype=float)
+    y = df[col_y].to_numpy(dtype=float)
+    idx = lttb_indices(x, y, max_points) if method == 'LTTB' else minmax_indices(y, max_points)
+    return df.iloc[idx]
+
+# --- Almacén ---
+@st.cache_resource
+def get_store():
+    # Una sola conexión por proceso; cada sesión trabaja con su propio cursor
+    os.makedirs(os.path.dirname(STORE_PATH) or '.', exist_ok=True)
+    return duckdb.connect(STORE_PATH)
+
+@st.cache_resource
+def store_lock():
+    # Las sesiones comparten el almacén: las anexiones se serializan para que el filtro por hash
+    # de una vea lo que otra acaba de guardar (dos transacciones concurrentes no se verían)
+    return threading.Lock()
+
+def table_exists(con, name: str) -> bool:
+    return con.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = ?", [name]).fetchone()[0] > 0
+
+def store_tables(con) -> list:
+    # Las tablas internas (hashes, cargas en curso) empiezan con '_'
+    rows = con.execute("""
+        SELECT table_name FROM duckdb_tables()
+        WHERE schema_name = 'main' AND NOT starts_with(table_name, '_')
+        ORDER BY 1
+    """).fetchall()
+    return [r[0] for r in rows]
+
+INT_TYPES = {'TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'UTINYINT', 'USMALLINT', 'UINTEGER', 'UBIGINT'}
+NUMERIC_TYPES = INT_TYPES | {'FLOAT', 'DOUBLE'}
+
+def widen_type(current: str, incoming: str) -> str:
+    # Tipo que admite ambos valores cuando un archivo/bloque difiere de la tabla
+    if current == incoming:
+        return current
+    if current in INT_TYPES and incoming in INT_TYPES:
+        return 'BIGINT'
+    numeric = [t in NUMERIC_TYPES or t.startswith('DECIMAL') for t in (current, incoming)]
+    if all(numeric):
+        return 'DOUBLE'
+    temporal = [t == 'DATE' or t.startswith('TIMESTAMP') for t in (current, incoming)]
+    if all(temporal):
+        return 'TIMESTAMP'
+    return 'VARCHAR'
+
+def store_append(con, area: str, source) -> int:
+    # source: DataFrame o consulta SELECT sobre la misma conexión
+    if isinstance(source, pd.DataFrame):
+        con.register('_nuevo', as_scannable(source))
+        query = "SELECT * FROM _nuevo"
+    else:
+        query = source
+    try:
+        if not table_exists(con, area):
+            return con.execute(f"CREATE TABLE {qi(area)} AS {query}").fetchone()[0]
+        # Columnas nuevas se agregan y las de tipo distinto se amplían
+        existing = {r[0]: r[1] for r in con.execute(f"DESCRIBE {qi(area)}").fetchall()}
+        for name, dtype, *_ in con.execute(f"DESCRIBE {query}").fetchall():
+            if name not in existing:
+                con.execute(f"ALTER TABLE {qi(area)} ADD COLUMN {qi(name)} {dtype}")
+            elif widen_type(existing[name], dtype) != existing[name]:
+                con.execute(f"ALTER TABLE {qi(area)} ALTER COLUMN {qi(name)} TYPE {widen_type(existing[name], dtype)}")
+        return con.execute(f"INSERT INTO {qi(area)} BY NAME {query}").fetchone()[0]
+    finally:
+        if isinstance(source, pd.DataFrame):
+            con.unregister('_nuevo')
+
+def store_append_new(con, area: str, source) -> Tuple[int, int]:
+    # Solo agrega filas cuyo hash no está ya en el almacén; devuelve (agregadas, ya_guardadas)
+    if isinstance(source, pd.DataFrame):
+        con.register('_nuevo_df', as_scannable(source))
+        query = "SELECT * FROM _nuevo_df"
+    else:
+        query = source
+    hashes = f"_hashes_{area}"
+    # Datos y hashes se escriben en una transacción: si algo falla no quedan desalineados
+    began = False
+    with store_lock():
         try:
-            df = load_file(file)
-            st.dataframe(df.head(5))
+            con.execute("BEGIN TRANSACTION")
+            began = True
+            cols = sorted(r[0] for r in con.execute(f"DESCRIBE {query}").fetchall())
+            row_hash = f"hash({', '.join(qi(c) for c in cols)})"
+            if not table_exists(con, hashes):
+                if table_exists(con, area):
+                    # Tabla guardada antes de llevar hashes: se indexa una vez
+                    stored = sorted(r[0] for r in con.execute(f"DESCRIBE {qi(area)}").fetchall())
+                    con.execute(f"CREATE TABLE {qi(hashes)} AS SELECT DISTINCT hash({', '.join(qi(c) for c in stored)}) AS h FROM {qi(area)}")
+                else:
+                    con.execute(f"CREATE TABLE {qi(hashes)} (h UBIGINT)")
+            con.execute(f"""
+                CREATE OR REPLACE TEMP TABLE _nuevas AS
+                SELECT q.* FROM (SELECT *, {row_hash} AS _row_hash FROM ({query})) q
+                ANTI JOIN {qi(hashes)} s ON q._row_hash = s.h
+                QUALIFY row_number() OVER (PARTITION BY q._row_hash) = 1
+            """)
+            total = con.execute(f"SELECT COUNT(*) FROM ({query})").fetchone()[0]
+            added = store_append(con, area, "SELECT * EXCLUDE (_row_hash) FROM _nuevas")
+            con.execute(f"INSERT INTO {qi(hashes)} SELECT _row_hash FROM _nuevas")
+            con.execute("DROP TABLE _nuevas")
+            con.execute("COMMIT")
+            return added, total - added
+        except Exception:
+            if began:
+                con.execute("ROLLBACK")
+            raise
+        finally:
+            if isinstance(source, pd.DataFrame):
+                con.unregister('_nuevo_df')
+
+def ingest_chunked(con, area: str, file, chunksize: int = CSV_CHUNK_ROWS, progress=None, **options) -> dict:
+    # Los bloques se acumulan en una tabla de paso y se deduplican en DuckDB, no en pandas.
+    # El sufijo aleatorio evita que dos sesiones que cargan el mismo archivo pisen su tabla de paso
+    staging = f"_carga_{file_digest(file)[:12]}_{uuid.uuid4().hex[:8]}"
+    con.execute(f"DROP TABLE IF EXISTS {qi(staging)}")
+    before_rows = 0
+    invalid_dates = {}
+    file.seek(0)
+    try:
+        for chunk in iter_chunks(file, chunksize, invalid_dates, **options):
+            before_rows += len(chunk)
+            store_append(con, staging, chunk)
+            if progress:
+                progress(min(file.tell() / max(file.size, 1), 1.0))
+        # Un bloque con una columna de texto toda nula la lee como número y no la rellena:
+        # el relleno 'Desconocido' se repite aquí sobre la tabla completa, como en standardized_select
+        described = con.execute(f"DESCRIBE {qi(staging)}").fetchall()
+        select = ', '.join(f"COALESCE({qi(c)}, 'Desconocido') AS {qi(c)}" if dtype == 'VARCHAR' else qi(c)
+                           for c, dtype, *_ in described)
+        query = f"SELECT DISTINCT {select} FROM {qi(staging)}"
+        after_rows = con.execute(f"SELECT COUNT(*) FROM ({query})").fetchone()[0]
+        _, already_stored = store_append_new(con, area, query)
+    finally:
+        con.execute(f"DROP TABLE IF EXISTS {qi(staging)}")
+    return {
+        'rows_before': before_rows,
+        'rows_after': after_rows,
+        'deduplicated': before_rows - after_rows,
+        'already_stored': already_stored,
+        'unparseable_dates': invalid_dates
+    }
+
+def ingest_duckdb(con, area: str, file) -> dict:
+    # Lectura, limpieza y deduplicación completas dentro de DuckDB, sin pasar por pandas
+    with spooled_path(file) as path:
+        source = duckdb_source(path, con)
+        before_rows = con.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+        formats = {}
+        query = f"SELECT DISTINCT {standardized_select(con, source, formats)} FROM {source}"
+        invalid_dates = {}
+        if formats:
+            counts = ', '.join(f"COUNT(*) FILTER ({qi(c)} IS NOT NULL AND try_strptime({qi(c)}, '{f}') IS NULL)"
+                               for c, f in formats.items())
+            invalid_dates = dict(zip(standardize_columns(pd.DataFrame(columns=list(formats))).columns,
+                                     con.execute(f"SELECT {counts} FROM {source}").fetchone()))
+        after_rows = con.execute(f"SELECT COUNT(*) FROM ({query})").fetchone()[0]
+        _, already_stored = store_append_new(con, area, query)
+    return {
+        'rows_before': before_rows,
+        'rows_after': after_rows,
+        'deduplicated': before_rows - after_rows,
+        'already_stored': already_stored,
+        'unparseable_dates': invalid_dates
+    }
+
+# --- Dashboard ---
+def make_chart(df: pd.DataFrame, chart_type: str, col_x: str, col_y: str, webgl: bool = None):
+    # webgl=None: SVG para pocos puntos, WebGL (Scattergl) por encima de WEBGL_MIN_POINTS
+    if webgl is None:
+        webgl = len(df) > WEBGL_MIN_POINTS
+    render_mode = 'webgl' if webgl else 'svg'
+    if chart_type == "Barras":
+        return px.bar(df, x=col_x, y=col_y, title=f"{col_y} por {col_x}")
+    if chart_type == "Líneas":
+        return px.line(df, x=col_x, y=col_y, title=f"{col_y} en el tiempo ({col_x})", render_mode=render_mode)
+    if chart_type == "Dispersión":
+        return px.scatter(df, x=col_x, y=col_y, title=f"{col_y} vs {col_x}", render_mode=render_mode)
+    if chart_type == "Pastel":
+        return px.pie(df, names=col_x, values=col_y, title=f"Distribución de {col_y} por {col_x}")
+    raise ValueError(f'Tipo de gráfico {chart_type} no soportado')
+
+@fragment
+def render_large_file(file, engine: str) -> None:
+    # Archivo grande: vista previa parcial y carga por bloques sin pasar por memoria.
+    # En Excel cada hoja elegida se carga por separado en la misma área
+    ext = os.path.splitext(file.name)[1].lower()
+    sheets = [None]
+    if ext == '.xlsx':
+        hojas = memoized(('hojas', file_digest(file)), lambda: excel_sheets(file))
+        sheets = st.multiselect(f"Hojas de {file.name}", hojas, default=hojas, key=f"hojas_{file.file_id}")
+        if sheets:
+            # La vista previa también se recuerda: abrirla relee el libro completo en cada rerun
+            vista = memoized(('vista_previa', file_digest(file), sheets[0]),
+                             lambda: next(iter_excel_chunks(file, 5, sheets[0]), pd.DataFrame()))
+            st.dataframe(vista)
+    elif ext in JSON_EXTS:
+        file.seek(0)
+        st.dataframe(next(iter_json_chunks(file, 5), pd.DataFrame()))
+    else:
+        file.seek(0)
+        st.dataframe(pd.read_csv(file, nrows=5))
+    area = st.selectbox(f"Selecciona el área de {file.name}", ['ventas', 'clientes', 'productos', 'otro'], key=f"area_{file.file_id}")
+    if st.button(f"📥 Cargar {file.name} por bloques al almacén", key=f"cargar_{file.file_id}"):
+        for sheet in sheets:
+            if engine == 'duckdb' and ext in ['.csv'] + JSON_EXTS:
+                report = ingest_duckdb(get_store().cursor(), area, file)
+            else:
+                barra = st.progress(0.0)
+                options = {'sheet_name': sheet} if sheet else {}
+                report = ingest_chunked(get_store().cursor(), area, file, progress=barra.progress, **options)
+            st.write(f"Reporte limpieza{f' ({sheet})' if sheet else ''}:", report)
+        st.success(f"Archivo cargado en '{area}'. Consúltalo en el modo 'Almacén local'.")
+
+@fragment
+def render_store_save(datasets: dict) -> None:
+    # Guardar no cambia el dashboard de la sesión: solo se re-ejecuta este bloque
+    if st.button("💾 Guardar en el almacén local"):
+        con_store = get_store().cursor()
+        for area, items in datasets.items():
+            results = [store_append_new(con_store, area, item['df']) for item in items]
+            saved, skipped = sum(r[0] for r in results), sum(r[1] for r in results)
+            st.success(f"{saved:,} filas nuevas guardadas en '{area}' ({skipped:,} ya estaban en el almacén)")
+
+def segment_filter(con, label: str, col: str, values: list, col_monto: str, version: tuple) -> list:
+    # Pocos valores: lista completa. Muchos (p. ej. miles de SKU): sin búsqueda se ofrecen los
+    # más vendidos y con búsqueda una página de coincidencias por prefijo; lo elegido se conserva
+    if len(values) <= SEGMENT_OPTIONS_MAX:
+        return st.multiselect(label, values)
+    key = f"filtro_{col}"
+    selected = st.session_state.get(key, [])
+    c1, c2 = st.columns([3, 1])
+    prefix = c1.text_input(f"Buscar en {len(values):,} valores de {col}", key=f"buscar_{col}")
+    if prefix:
+        index = memoized(('prefijos', version, col), lambda: prefix_index(values))
+        lo, hi = prefix_range(index, prefix)
+        pages = max(1, -(-(hi - lo) // SEGMENT_PAGE_SIZE))
+        page = c2.number_input("Página", 1, pages, 1, key=f"pagina_{col}_{prefix}")
+        start = lo + (page - 1) * SEGMENT_PAGE_SIZE
+        results = index[1][start:min(start + SEGMENT_PAGE_SIZE, hi)].tolist()
+        st.caption(f"{hi - lo:,} coincidencias")
+    else:
+        results = memoized(('mas_vendidos', version, col, col_monto),
+                           lambda: query_by(con, col, col_monto, {}, limit=SEGMENT_PAGE_SIZE)[col].tolist())
+    options = selected + [v for v in results if v not in selected]
+    return st.multiselect(label, options, key=key)
+
+@fragment
+def render_profile(con, table: str, version: tuple) -> None:
+    # El perfil se calcula al pedirlo y queda en caché mientras no cambie el dataset
+    if st.toggle(f"🔎 Ver perfil de columnas de '{table}'"):
+        st.dataframe(memoized(('perfil', version, table), lambda: profile_table(con, table)))
+
+def render_dashboard(con, table: str, version: tuple) -> None:
+    # version identifica el contenido de la tabla; cambia cuando cambian los datos
+    st.subheader("📊 Dashboard Automático")
+    columns = [r[0] for r in con.execute(f"DESCRIBE {qi(table)}").fetchall()]
+    render_profile(con, table, version)
+
+    # 🔍 Detección automática de columnas clave (una vez por versión del dataset)
+    roles = memoized(('roles', version), lambda: detect_roles(con, table))
+    col_monto = roles['monto']
+    col_fecha = roles['fecha']
+
+    if not col_monto:
+        col_monto = st.selectbox("Selecciona la columna de monto o venta", columns)
+    if not col_fecha:
+        col_fecha = st.selectbox("Selecciona la columna de fecha", columns)
+
+    # Filtros activos {columna: valores}; se traducen a un WHERE en DuckDB
+    filters = {}
+    col_prod, col_loc, col_reg = (roles[r] for r in DIMENSION_ROLES)
+
+    # ------------------------------
+    # 🔥 🔥 🔥 NUEVA SECCIÓN: SEGMENTADORES 🔥 🔥 🔥
+    # ------------------------------
+    if col_monto and col_fecha:
+        create_base_view(con, table, col_fecha)
+
+        st.subheader("🎯 Segmentadores de Datos")
+
+        # Cubo de agregados y opciones de los segmentadores, calculados una vez por versión del dataset
+        dims = [c for c in (col_prod, col_loc, col_reg) if c]
+        cubo = cached_cube(con, version, col_fecha, col_monto, dims)
+        register_cube(con, cubo, col_fecha, col_monto, dims)
+        segmentos = ['año'] + dims
+        opciones = memoized(('segmentos', version, col_fecha, tuple(segmentos)), lambda: segment_options(con, segmentos))
+
+        # Si existe columna de fecha, permitir filtrar por año
+        años_disponibles = opciones['año']
+        año_sel = st.radio("Selecciona el año", ["Todos"] + list(map(str, años_disponibles)), horizontal=True)
+        if año_sel != "Todos":
+            filters['año'] = [int(año_sel)]
+
+        # Filtros por producto, local y región
+        if col_prod:
+            filters[col_prod] = segment_filter(con, "Filtrar por producto", col_prod, opciones[col_prod], col_monto, version)
+
+        if col_loc:
+            filters[col_loc] = segment_filter(con, "Filtrar por local o tienda", col_loc, opciones[col_loc], col_monto, version)
+
+        if col_reg:
+            filters[col_reg] = segment_filter(con, "Filtrar por región o ciudad", col_reg, opciones[col_reg], col_monto, version)
+    # ------------------------------
+    # 🔥 FIN NUEVA SECCIÓN 🔥
+    # ------------------------------
+
+    # Las figuras se reutilizan mientras no cambien los datos, los filtros ni su configuración
+    figure_key = (version, col_fecha, col_monto, tuple((c, tuple(v)) for c, v in filters.items() if v))
+
+    if col_monto and col_fecha:
+        ingreso_total = query_total(con, col_monto, filters)
+        st.metric("Ingreso total", f"${ingreso_total:,.0f}")
+
+        try:
+            fig_trend = cached_figure(figure_key + ('tendencia',), lambda: px.line(
+                downsample(query_trend(con, col_fecha, col_monto, filters), col_fecha, col_monto),
+                x=col_fecha, y=col_monto, title='📈 Ingreso Mensual'))
+            st.plotly_chart(fig_trend)
         except Exception as e:
-            st.error(f"Error al leer {file.name}: {e}")
-            continue
-        
-        area = st.selectbox(f"Selecciona el área de {file.name}", ['ventas', 'clientes', 'productos', 'otro'])
-        df_clean, report = clean_table(df, table_type=area)
-        st.write("Reporte limpieza:", report)
-
-        if area not in datasets:
-            datasets[area] = []
-        datasets[area].append({'filename': file.name, 'df': df_clean})
-
-    # --- Combinar datos y generar dashboard ---
-    if 'ventas' in datasets:
-        df_ventas = pd.concat([item['df'] for item in datasets['ventas']], ignore_index=True)
-        con = duckdb.connect(database=':memory:')
-        con.register('ventas', df_ventas)
-        df_master = df_ventas.copy()
-
-        st.subheader("📊 Dashboard Automático")
-
-        # 🔍 Detección automática de columnas clave
-        col_monto = next((c for c in df_master.columns if any(k in c for k in ['venta', 'monto', 'total', 'ingreso'])), None)
-        col_fecha = next((c for c in df_master.columns if any(k in c for k in ['fecha', 'date'])), None)
-
-        if not col_monto:
-            col_monto = st.selectbox("Selecciona la columna de monto o venta", df_master.columns)
-        if not col_fecha:
-            col_fecha = st.selectbox("Selecciona la columna de fecha", df_master.columns)
-
-        # ------------------------------
-        # 🔥 🔥 🔥 NUEVA SECCIÓN: SEGMENTADORES 🔥 🔥 🔥
-        # ------------------------------
-        if col_monto and col_fecha:
-            # --- 🔍 Detectar posibles columnas para segmentar ---
-            posibles_productos = [c for c in df_master.columns if any(k in c for k in ['producto', 'item', 'articulo', 'sku'])]
-            posibles_locales = [c for c in df_master.columns if any(k in c for k in ['local', 'tienda', 'sucursal'])]
-            posibles_regiones = [c for c in df_master.columns if any(k in c for k in ['region', 'ciudad', 'zona', 'pais'])]
-
-            st.subheader("🎯 Segmentadores de Datos")
-
-            # Si existe columna de fecha, permitir filtrar por año
-            df_master[col_fecha] = pd.to_datetime(df_master[col_fecha], errors='coerce')
-            df_master = df_master.dropna(subset=[col_fecha])
-            df_master['año'] = df_master[col_fecha].dt.year
-
-            años_disponibles = sorted(df_master['año'].dropna().unique())
-            año_sel = st.radio("Selecciona el año", ["Todos"] + list(map(str, años_disponibles)), horizontal=True)
-            if año_sel != "Todos":
-                df_master = df_master[df_master['año'] == int(año_sel)]
-
-            # Filtros por producto, local y región
-            if posibles_productos:
-                productos_sel = st.multiselect("Filtrar por producto", sorted(df_master[posibles_productos[0]].unique()))
-                if productos_sel:
-                    df_master = df_master[df_master[posibles_productos[0]].isin(productos_sel)]
-
-            if posibles_locales:
-                locales_sel = st.multiselect("Filtrar por local o tienda", sorted(df_master[posibles_locales[0]].unique()))
-                if locales_sel:
-                    df_master = df_master[df_master[posibles_locales[0]].isin(locales_sel)]
-
-            if posibles_regiones:
-                regiones_sel = st.multiselect("Filtrar por región o ciudad", sorted(df_master[posibles_regiones[0]].unique()))
-                if regiones_sel:
-                    df_master = df_master[df_master[posibles_regiones[0]].isin(regiones_sel)]
-        # ------------------------------
-        # 🔥 FIN NUEVA SECCIÓN 🔥
-        # ------------------------------
-
-        if col_monto and col_fecha:
-            ingreso_total = df_master[col_monto].sum()
-            st.metric("Ingreso total", f"${ingreso_total:,.0f}")
+            st.warning(f"No se pudo generar la serie temporal: {e}")
+    else:
+        st.warning("⚠️ No se encontraron columnas adecuadas de fecha o monto para generar el gráfico.")
+
+    # Dependencias: los filtros alimentan al análisis automático y a los gráficos personalizados.
+    # Cambiar un filtro re-ejecuta todo; el análisis y los gráficos personalizados se re-ejecutan solos
+    render_analysis(con, filters, figure_key, col_monto, col_prod, col_loc, col_reg)
+    render_custom_charts(con, filters, figure_key)
+
+@fragment
+def render_analysis(con, filters: dict, figure_key: tuple, col_monto: str, col_prod: str, col_loc: str, col_reg: str) -> None:
+    # --- 🔥 NUEVA SECCIÓN: Gráficos Automáticos Inteligentes ---
+    st.subheader("🤖 Análisis Automático")
+    top_n = st.slider("Cantidad de elementos en los rankings", 3, 50, TOP_N)
+
+    # Top 10 productos más vendidos. Los rankings fijan el eje X como categoría: con códigos
+    # numéricos Plotly lo haría lineal y perdería la barra 'Otros'
+    if col_prod and col_monto:
+        fig_top = cached_figure(figure_key + ('top_productos', col_prod, top_n), lambda: px.bar(
+            query_top(con, col_prod, col_monto, filters, top_n),
+            x=col_prod, y=col_monto, title=f"🏆 Top {top_n} productos más vendidos").update_xaxes(type='category'))
+        st.plotly_chart(fig_top, use_container_width=True)
+
+    # Locales con mayores ventas
+    if col_loc and col_monto:
+        fig_loc = cached_figure(figure_key + ('top_locales', col_loc, top_n), lambda: px.bar(
+            query_top(con, col_loc, col_monto, filters, top_n),
+            x=col_loc, y=col_monto, title="🏪 Locales con mayores ventas").update_xaxes(type='category'))
+        st.plotly_chart(fig_loc, use_container_width=True)
+
+    # Ventas por región o ciudad
+    if col_reg and col_monto:
+        fig_reg = cached_figure(figure_key + ('regiones', col_reg), lambda: px.pie(
+            query_by(con, col_reg, col_monto, filters),
+            names=col_reg, values=col_monto, title="🌎 Ventas por región o ciudad"))
+        st.plotly_chart(fig_reg, use_container_width=True)
+
+@fragment
+def render_custom_charts(con, filters: dict, figure_key: tuple) -> None:
+    # --- 🎨 Gráficos Personalizados ---
+    st.subheader("🎨 Crea tus propios gráficos")
+    st.write("Selecciona qué columnas quieres graficar y el tipo de gráfico.")
+
+    tipos = column_types(con, 'ventas_base')
+    numeric_cols = [c for c, t in tipos.items() if t in NUMERIC_TYPES or t.startswith('DECIMAL')]
+    all_cols = list(tipos)
+
+    col_x = st.selectbox("Eje X (categoría o fecha)", all_cols)
+    col_y = st.selectbox("Eje Y (valor numérico)", numeric_cols)
+    chart_type = st.radio("Tipo de gráfico", ["Barras", "Líneas", "Dispersión", "Pastel"], horizontal=True)
+    agg = reduccion = None
+    if chart_type != "Dispersión":
+        agg = st.radio("Agregación por valor de X", list(AGGREGATIONS), horizontal=True)
+    if chart_type == "Líneas":
+        reduccion = st.radio(f"Reducción a {LINE_POINT_BUDGET:,} puntos", ["LTTB", "Mín/Máx"], horizontal=True)
+
+    col_valor = custom_value_name(agg, col_y) if agg else col_y
+    max_points = LINE_FETCH_POINTS if chart_type == "Líneas" else MAX_CHART_POINTS
+
+    def build_custom():
+        # Se grafica el resultado agregado (como máximo MAX_CHART_POINTS puntos), no las filas
+        if chart_type == "Líneas":
+            df_plot = downsample(query_custom(con, col_x, col_y, agg, filters, max_points=max_points),
+                                 col_x, col_valor, method=reduccion)
+        elif chart_type == "Dispersión":
+            df_plot = query_sample(con, col_x, col_y, filters)
+        else:
+            df_plot = query_custom(con, col_x, col_y, agg, filters, max_points=max_points)
+        return make_chart(df_plot, chart_type, col_x, col_valor)
 
+    if col_x and col_y:
+        fig = cached_figure(figure_key + ('personalizado', col_x, col_y, chart_type, agg, reduccion), build_custom)
+        st.plotly_chart(fig, use_container_width=True)
+        # Un eje X de texto no se agrupa en intervalos: avisar si quedaron valores fuera
+        tipo_x = tipos[col_x]
+        if agg and not (tipo_x in NUMERIC_TYPES or tipo_x.startswith(('DECIMAL', 'DATE', 'TIMESTAMP'))):
+            distintos = memoized(figure_key + ('distintos', col_x), lambda: query_distinct(con, col_x, filters))
+            if distintos > max_points:
+                st.caption(f"Se muestran los {max_points:,} valores de {col_x} con mayor {col_valor.lower()}, de {distintos:,} en total.")
+
+# --- Streamlit UI ---
+st.title("🚀 Generador de Dashboards Interactivos")
+modo = st.sidebar.radio("Origen de datos", ["Subir archivos", "Almacén local"])
+engine = st.sidebar.radio("Motor de lectura (CSV/JSON)", ['pandas', 'duckdb'], horizontal=True)
+arrow = st.sidebar.toggle("Tipos Arrow y categorías (menos memoria)")
+
+if modo == "Subir archivos":
+    st.write("Sube tus archivos Excel, CSV, JSON o Parquet para generar dashboards automáticamente.")
+
+    uploaded_files = st.file_uploader("Sube tus archivos", type=['csv','xlsx','xls','json','ndjson','jsonl','parquet','feather','arrow','ipc','gz','bz2','zst','zip'], accept_multiple_files=True)
+
+    if uploaded_files:
+        datasets = {}
+        seen_hashes = {}
+        # Los comprimidos se abren en sus archivos: cada uno es un dataset aparte
+        archivos = []
+        for upload in uploaded_files:
             try:
-                df_trend = df_master.set_index(col_fecha).resample('M')[col_monto].sum().reset_index()
-                fig_trend = px.line(df_trend, x=col_fecha, y=col_monto, title='📈 Ingreso Mensual')
-                st.plotly_chart(fig_trend)
+                archivos.extend(expand_upload(upload))
             except Exception as e:
-                st.warning(f"No se pudo generar la serie temporal: {e}")
-        else:
-            st.warning("⚠️ No se encontraron columnas adecuadas de fecha o monto para generar el gráfico.")
-
-        # --- 🔥 NUEVA SECCIÓN: Gráficos Automáticos Inteligentes ---
-        st.subheader("🤖 Análisis Automático")
-        posibles_productos = [c for c in df_master.columns if any(k in c for k in ['producto', 'item', 'articulo', 'sku'])]
-        posibles_locales = [c for c in df_master.columns if any(k in c for k in ['local', 'tienda', 'sucursal'])]
-        posibles_regiones = [c for c in df_master.columns if any(k in c for k in ['region', 'ciudad', 'zona', 'pais'])]
-
-        # Top 10 productos más vendidos
-        if posibles_productos and col_monto:
-            col_prod = posibles_productos[0]
-            df_top = df_master.groupby(col_prod)[col_monto].sum().reset_index().sort_values(col_monto, ascending=False).head(10)
-            fig_top = px.bar(df_top, x=col_prod, y=col_monto, title="🏆 Top 10 productos más vendidos")
-            st.plotly_chart(fig_top, use_container_width=True)
-
-        # Locales con mayores ventas
-        if posibles_locales and col_monto:
-            col_loc = posibles_locales[0]
-            df_loc = df_master.groupby(col_loc)[col_monto].sum().reset_index().sort_values(col_monto, ascending=False).head(10)
-            fig_loc = px.bar(df_loc, x=col_loc, y=col_monto, title="🏪 Locales con mayores ventas")
-            st.plotly_chart(fig_loc, use_container_width=True)
-
-        # Ventas por región o ciudad
-        if posibles_regiones and col_monto:
-            col_reg = posibles_regiones[0]
-            df_reg = df_master.groupby(col_reg)[col_monto].sum().reset_index().sort_values(col_monto, ascending=False)
-            fig_reg = px.pie(df_reg, names=col_reg, values=col_monto, title="🌎 Ventas por región o ciudad")
-            st.plotly_chart(fig_reg, use_container_width=True)
-
-        # --- 🎨 Gráficos Personalizados ---
-        st.subheader("🎨 Crea tus propios gráficos")
-        st.write("Selecciona qué columnas quieres graficar y el tipo de gráfico.")
-
-        numeric_cols = df_master.select_dtypes(include=['number']).columns.tolist()
-        all_cols = df_master.columns.tolist()
-
-        col_x = st.selectbox("Eje X (categoría o fecha)", all_cols)
-        col_y = st.selectbox("Eje Y (valor numérico)", numeric_cols)
-        chart_type = st.radio("Tipo de gráfico", ["Barras", "Líneas", "Pastel"], horizontal=True)
-
-        if col_x and col_y:
-            if chart_type == "Barras":
-                fig = px.bar(df_master, x=col_x, y=col_y, title=f"{col_y} por {col_x}")
-            elif chart_type == "Líneas":
-                fig = px.line(df_master, x=col_x, y=col_y, title=f"{col_y} en el tiempo ({col_x})")
-            elif chart_type == "Pastel":
-                df_grouped = df_master.groupby(col_x)[col_y].sum().reset_index()
-                fig = px.pie(df_grouped, names=col_x, values=col_y, title=f"Distribución de {col_y} por {col_x}")
-            
-            st.plotly_chart(fig, use_container_width=True)
+                st.error(f"Error al leer {upload.name}: {e}")
+        # CSV y JSON se leen y preparan primero todos juntos en paralelo; el resto de la página usa la caché
+        base_options = {'engine': engine, 'dtype_backend': 'pyarrow' if arrow else None}
+        lectura = st.empty()
+        errores = prefetch_files(
+            [f for f in archivos if os.path.splitext(f.name)[1].lower() in ['.csv'] + JSON_EXTS and not needs_chunked(f)],
+            base_options, compact=arrow, progress=lambda frac, text: lectura.progress(frac, text=text))
+        lectura.empty()
+        for file in archivos:
+            st.subheader(f"Procesando: {file.name}")
+            ext = os.path.splitext(file.name)[1].lower()
+            if needs_chunked(file):
+                render_large_file(file, engine)
+                continue
+            # Libro con varias hojas: cada hoja elegida es un dataset aparte
+            sheets = [None]
+            if ext in ['.xls', '.xlsx']:
+                try:
+                    hojas = memoized(('hojas', file_digest(file)), lambda: excel_sheets(file))
+                except Exception as e:
+                    st.error(f"Error al leer {file.name}: {e}")
+                    continue
+                if len(hojas) > 1:
+                    sheets = st.multiselect(f"Hojas de {file.name}", hojas, default=hojas, key=f"hojas_{file.file_id}")
+            # Parquet/Arrow: solo se leen las columnas elegidas
+            columns = None
+            if ext in ARROW_EXTS:
+                try:
+                    disponibles = memoized(('columnas', file_digest(file)), lambda: arrow_columns(file))
+                except Exception as e:
+                    st.error(f"Error al leer {file.name}: {e}")
+                    continue
+                elegidas = st.multiselect(f"Columnas de {file.name}", disponibles, default=disponibles, key=f"columnas_{file.file_id}")
+                if elegidas and len(elegidas) < len(disponibles):
+                    columns = tuple(elegidas)
+            for sheet in sheets:
+                name = f"{file.name} [{sheet}]" if sheet else file.name
+                options = dict(base_options)
+                if sheet:
+                    options['sheet_name'] = sheet
+                if columns:
+                    options['columns'] = columns
+                try:
+                    if parse_key(file, options) in errores:
+                        raise errores[parse_key(file, options)]
+                    df = load_file_cached(file, **options)
+                    st.dataframe(df.head(5))
+                except Exception as e:
+                    st.error(f"Error al leer {name}: {e}")
+                    continue
+
+                # Clave por file_id: dos archivos con el mismo nombre (p. ej. dentro de distintos .zip) no chocan
+                area = st.selectbox(f"Selecciona el área de {name}", ['ventas', 'clientes', 'productos', 'otro'], key=f"area_{file.file_id}_{sheet}")
+                prior = tuple(item['key'] for item in datasets.get(area, []))
+                df_clean, report = clean_table_cached(file, df, options, area, arrow, seen_hashes.setdefault(area, []), prior)
+                st.write("Reporte limpieza:", report)
+                if arrow:
+                    with st.expander("Memoria por columna"):
+                        st.dataframe(memory_report(df, df_clean))
+
+                if area not in datasets:
+                    datasets[area] = []
+                datasets[area].append({'filename': name, 'file': file, 'key': parse_key(file, options), 'df': df_clean})
 
+        # --- Guardar en el almacén para no volver a subir los archivos ---
+        if datasets:
+            render_store_save(datasets)
+
+        # --- Combinar datos y generar dashboard ---
+        if 'ventas' in datasets:
+            con = duckdb.connect(database=':memory:')
+            register_union(con, 'ventas', [item['df'] for item in datasets['ventas']])
+            render_dashboard(con, 'ventas', tuple(item['key'] for item in datasets['ventas']) + (arrow,))
+else:
+    con = get_store().cursor()
+    tablas = store_tables(con)
+    if not tablas:
+        st.info("El almacén está vacío. Sube archivos y guárdalos desde 'Subir archivos'.")
+    else:
+        conteos = {t: con.execute(f"SELECT COUNT(*) FROM {qi(t)}").fetchone()[0] for t in tablas}
+        st.write("Tablas en el almacén:", conteos)
+        if 'ventas' in tablas:
+            # El almacén solo crece por anexión: el conteo de filas identifica la versión
+            render_dashboard(con, 'ventas', ('almacen', STORE_PATH, conteos['ventas']))
@@ -0,0 +1,248 @@
+"""Benchmarks del dashboard.
+
+Uso:
+    python benchmark.py lectura --rows 1000000 10000000
+    python benchmark.py memoria --rows 200000 1000000
+    python benchmark.py graficos --points 10000 100000 1000000
+    python benchmark.py top --groups 1000000 --rows 5000000
+    python benchmark.py excel --rows 100000 500000
+"""
+import argparse
+import io
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+# app.py es un script de Streamlit: al importarlo fuera de `streamlit run` solo emite avisos
+logging.getLogger('streamlit').setLevel(logging.ERROR)
+import app  # noqa: E402
+
+
+class Upload(io.BytesIO):
+    # Imita el UploadedFile de Streamlit (name, size, file_id)
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            super().__init__(f.read())
+        self.name = os.path.basename(path)
+        self.size = len(self.getvalue())
+        self.file_id = path
+
+
+def sales_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Fecha': pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 4 * 365 * 24, rows), unit='h'),
+        'Producto': pd.Series(rng.integers(0, 5000, rows)).map('SKU-{:05d}'.format),
+        'Local': pd.Series(rng.integers(0, 200, rows)).map('Local {}'.format),
+        'Region': rng.choice(['Norte', 'Sur', 'Centro', 'Oriente', 'Poniente'], rows),
+        'Monto Total': rng.gamma(2.0, 50.0, rows).round(2),
+        'Cantidad': rng.integers(1, 10, rows),
+    })
+
+
+def timed(fn, repeat: int = 1) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_lectura(args) -> None:
+    print(f"{'filas':>12} {'formato':>8} {'pandas (s)':>12} {'duckdb (s)':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            df = sales_frame(rows)
+            paths = {'csv': os.path.join(tmp, 'ventas.csv')}
+            df.to_csv(paths['csv'], index=False)
+            if rows <= args.max_json_rows:
+                paths['json'] = os.path.join(tmp, 'ventas.json')
+                df.to_json(paths['json'], orient='records', date_format='iso')
+            del df
+            for fmt, path in paths.items():
+                res = {engine: timed(lambda: app.load_file(Upload(path), engine=engine), args.repeat)
+                       for engine in ['pandas', 'duckdb']}
+                print(f"{rows:>12,} {fmt:>8} {res['pandas']:>12.2f} {res['duckdb']:>12.2f}")
+
+
+def dashboard_pipeline(upload, **options) -> tuple:
+    raw = app.load_file(upload, **options)
+    df, _ = app.clean_table(raw, seen=[])
+    con = duckdb.connect()
+    app.register_union(con, 'ventas', [df])
+    app.create_base_view(con, 'ventas', 'fecha')
+    dims = ['producto', 'local', 'region']
+    app.register_cube(con, app.build_cube(con, 'fecha', 'monto_total', dims), 'fecha', 'monto_total', dims)
+    filters = {'año': [2021], 'region': ['Norte', 'Sur']}
+    app.query_total(con, 'monto_total', filters)
+    app.query_trend(con, 'fecha', 'monto_total', filters)
+    app.query_by(con, 'producto', 'monto_total', filters, limit=10)
+    return raw, con
+
+
+def memory_run(path: str, warmup_path: str, options: dict) -> dict:
+    # Corre en un proceso nuevo: su pico de RSS (ru_maxrss) mide solo esta carga, incluida la memoria
+    # nativa de pandas, pyarrow y DuckDB que tracemalloc no ve. Una pasada con pocas filas carga antes
+    # las librerías; la base se toma con el archivo ya subido, justo antes de leerlo
+    dashboard_pipeline(Upload(warmup_path), **options)
+    upload = Upload(path)
+    with open('/proc/self/statm') as f:
+        base = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    _, con = dashboard_pipeline(upload, **options)
+    result = {
+        'peak': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - base,
+        'duckdb': int(con.execute("SELECT COALESCE(SUM(memory_usage_bytes), 0) FROM duckdb_memory()").fetchone()[0]),
+        'arrow': 0,
+    }
+    if app.HAS_PYARROW:
+        import pyarrow as pa
+        result['arrow'] = pa.default_memory_pool().max_memory()
+    return result
+
+
+MEMORY_MODES = {
+    # Camino por defecto: pd.read_csv arma el texto como objetos Python antes de pasarlo a columnas
+    'pandas': ({}, False),
+    # Sin copias: DuckDB lee directo a Arrow y pandas usa esas columnas sin convertirlas.
+    # Es el modo que se exige bajo --max-ratio
+    'duckdb+arrow': ({'engine': 'duckdb', 'dtype_backend': 'pyarrow'}, True),
+}
+
+
+def bench_memoria(args) -> None:
+    # Pico de RSS de lectura + limpieza + consultas del dashboard, relativo al DataFrame crudo
+    # (el archivo leído con pd.read_csv por defecto). Sale con error si el modo sin copias supera
+    # --max-ratio (por defecto, 200.000 filas: corre en segundos)
+    status = 0
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = os.path.join(tmp, 'ventas.csv')
+            sales_frame(rows).to_csv(path, index=False)
+            warmup_path = os.path.join(tmp, 'ventas_warmup.csv')
+            sales_frame(1000).to_csv(warmup_path, index=False)
+            raw = int(pd.read_csv(path).memory_usage(deep=True).sum())
+            for mode, (options, checked) in MEMORY_MODES.items():
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                    res = pool.submit(memory_run, path, warmup_path, options).result()
+                ratio = res['peak'] / raw
+                ok = ratio <= args.max_ratio or not checked
+                status |= not ok
+                verdict = ('OK' if ok else 'EXCEDE') if checked else '-'
+                print(f"{rows:>12,} filas  {mode:>12}  crudo {raw / 1e6:8.1f} MB  pico RSS {res['peak'] / 1e6:8.1f} MB "
+                      f"({ratio:.2f}x)  arrow {res['arrow'] / 1e6:7.1f} MB  duckdb {res['duckdb'] / 1e6:7.1f} MB  {verdict}")
+    sys.exit(status)
+
+
+def bench_graficos(args) -> None:
+    # Construcción de la figura y serialización a JSON (lo que viaja al navegador), SVG vs WebGL
+    print(f"{'puntos':>10} {'tipo':>11} {'modo':>6} {'figura (s)':>11} {'json (s)':>9} {'json (MB)':>10}")
+    rng = np.random.default_rng(0)
+    for n in args.points:
+        df = pd.DataFrame({'x': np.arange(n), 'y': rng.normal(size=n).cumsum()})
+        for chart_type in ['Líneas', 'Dispersión']:
+            for webgl in [False, True]:
+                start = time.perf_counter()
+                fig = app.make_chart(df, chart_type, 'x', 'y', webgl=webgl)
+                built = time.perf_counter() - start
+                start = time.perf_counter()
+                payload = fig.to_json()
+                serialized = time.perf_counter() - start
+                print(f"{n:>10,} {chart_type:>11} {'webgl' if webgl else 'svg':>6} "
+                      f"{built:>11.3f} {serialized:>9.3f} {len(payload) / 1e6:>10.1f}")
+
+
+def bench_excel(args) -> None:
+    # pd.read_excel con openpyxl (lector anterior) vs calamine vs lectura por bloques en modo solo lectura
+    print(f"{'filas':>10} {'lector':>22} {'tiempo (s)':>11} {'pico (MB)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = os.path.join(tmp, 'ventas.xlsx')
+            sales_frame(rows).to_excel(path, index=False)
+            readers = [('read_excel openpyxl', lambda: pd.read_excel(path, engine='openpyxl'))]
+            if app.HAS_CALAMINE:
+                readers.append(('read_excel calamine', lambda: pd.read_excel(path, engine='calamine')))
+            readers.append(('iter_excel_chunks', lambda: sum(len(c) for c in app.iter_excel_chunks(Upload(path)))))
+            for name, fn in readers:
+                elapsed = timed(fn)
+                # Segunda pasada para el pico: tracemalloc hace mucho más lento a openpyxl
+                tracemalloc.start()
+                fn()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"{rows:>10,} {name:>22} {elapsed:>11.2f} {peak / 1e6:>10.1f}")
+
+
+def bench_top(args) -> None:
+    # Top-N con 'Otros': orden completo de pandas vs nlargest (heap) vs ORDER BY ... LIMIT en DuckDB
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'producto': pd.Series(rng.integers(0, args.groups, args.rows)).map('SKU-{:07d}'.format),
+        'monto_total': rng.gamma(2.0, 50.0, args.rows).round(2),
+    })
+    con = duckdb.connect()
+    con.register('ventas_cube', app.as_scannable(df))
+    n = args.n
+
+    def full_sort():
+        g = df.groupby('producto')['monto_total'].sum().reset_index().sort_values('monto_total', ascending=False)
+        return g.head(n), g['monto_total'].iloc[n:].sum()
+
+    def nlargest():
+        g = df.groupby('producto')['monto_total'].sum()
+        top = g.nlargest(n)
+        return top, g.sum() - top.sum()
+
+    print(f"{args.rows:,} filas, {df['producto'].nunique():,} grupos, N={n}")
+    for name, fn in [('pandas sort_values', full_sort), ('pandas nlargest', nlargest),
+                     ('duckdb query_top', lambda: app.query_top(con, 'producto', 'monto_total', {}, n))]:
+        print(f"{name:>20} {timed(fn, args.repeat):8.3f} s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('lectura', help='load_file: motor pandas vs duckdb')
+    p.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    p.add_argument('--max-json-rows', type=int, default=1_000_000)
+    p.add_argument('--repeat', type=int, default=1)
+    p.set_defaults(func=bench_lectura)
+
+    p = sub.add_parser('memoria', help='pico de RSS de lectura + limpieza + dashboard vs tamaño crudo')
+    p.add_argument('--rows', type=int, nargs='+', default=[200_000])
+    p.add_argument('--max-ratio', type=float, default=2.0)
+    p.set_defaults(func=bench_memoria)
+
+    p = sub.add_parser('graficos', help='tiempo de figura + JSON de Plotly, SVG vs WebGL')
+    p.add_argument('--points', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    p.set_defaults(func=bench_graficos)
+
+    p = sub.add_parser('excel', help='lectores de Excel: openpyxl vs calamine vs por bloques')
+    p.add_argument('--rows', type=int, nargs='+', default=[100_000, 500_000])
+    p.set_defaults(func=bench_excel)
+
+    p = sub.add_parser('top', help='top-N + Otros: orden completo vs nlargest vs DuckDB')
+    p.add_argument('--groups', type=int, default=1_000_000)
+    p.add_argument('--rows', type=int, default=5_000_000)
+    p.add_argument('-n', type=int, default=10)
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=bench_top)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()